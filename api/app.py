@@ -1,13 +1,19 @@
 from fastapi import FastAPI, UploadFile, File
 from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
-import pandas as pd, io
+import pandas as pd
+
+CHUNK_ROWS = 200_000
 
 app = FastAPI()
 app.mount("/", StaticFiles(directory="static", html=True), name="static")
 
 @app.post("/parse")
-async def parse_csv(file: UploadFile = File(...)):
-    content = await file.read()
-    df = pd.read_csv(io.BytesIO(content))
-    return JSONResponse({"rows": int(len(df)), "cols": int(len(df.columns))})
+def parse_csv(file: UploadFile = File(...)):
+    # Stream the spooled upload in chunks instead of holding it in memory twice
+    rows, cols = 0, 0
+    with pd.read_csv(file.file, chunksize=CHUNK_ROWS) as reader:
+        for chunk in reader:
+            rows += len(chunk)
+            cols = cols or len(chunk.columns)
+    return JSONResponse({"rows": rows, "cols": cols})
@@ -15,22 +15,38 @@ v1.7 additions
 - Preserves duplicate Jira columns on export by removing pandas .1/.2 suffixes only at download time
 """
 
-import json
+import io
 import re
-from typing import List, Dict, Any
+from functools import lru_cache
+from typing import List, Dict, Any, Optional
 
 import pandas as pd
 import streamlit as st
 
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+
 # ---------------------------
 # Helpers
 # ---------------------------
 
+@lru_cache(maxsize=8)
+def _lowered_cols(cols: tuple) -> tuple:
+    """(name, lowercased name) pairs, computed once per column list."""
+    return tuple((c, c.lower()) for c in cols)
+
+
 def find_col(cols: List[str], needle: str) -> str:
     """Find the FIRST column whose name contains `needle` (case-insensitive)."""
     needle_low = needle.lower()
-    for c in cols:
-        if needle_low in c.lower():
+    for c, c_low in _lowered_cols(tuple(cols)):
+        if needle_low in c_low:
             return c
     return ""
 
@@ -49,13 +65,7 @@ def get_strict_cols(cols: List[str], needle: str) -> List[str]:
     Find strictly the duplicate columns generated by pandas for a specific field.
     E.g. needle="Labels" -> exactly "Labels", "Labels.1", "Labels.2"
     """
-    needle_low = needle.lower()
-    base_col = None
-    for c in cols:
-        if needle_low in c.lower():
-            base_col = c
-            break
-
+    base_col = find_col(cols, needle)
     if not base_col:
         return []
 
@@ -68,19 +78,21 @@ def get_strict_cols(cols: List[str], needle: str) -> List[str]:
 
 def get_prefixed_cols(cols: List[str], prefixes: List[str]) -> List[str]:
     """Return columns that start with any prefix; useful for issue link fields."""
-    out = []
-    for c in cols:
-        c_low = c.lower()
-        if any(c_low.startswith(p.lower()) for p in prefixes):
-            out.append(c)
-    return out
+    prefixes_low = tuple(p.lower() for p in prefixes)
+    return [c for c, c_low in _lowered_cols(tuple(cols)) if c_low.startswith(prefixes_low)]
+
+
+_WS_RE = re.compile(r"\s+")
 
 
 def _clean_text(x: Any) -> str:
-    s = str(x) if x is not None else ""
-    s = s.replace("\u00a0", " ")
-    s = re.sub(r"\s+", " ", s, flags=re.UNICODE).strip()
-    return s
+    s = x if isinstance(x, str) else ("" if x is None else str(x))
+    if not s:
+        return ""
+    # Printable ASCII without double spaces has nothing to collapse
+    if s.isascii() and s.isprintable() and "  " not in s:
+        return s.strip()
+    return _WS_RE.sub(" ", s).strip()
 
 
 def _join_non_empty(values: List[Any], sep: str = " | ") -> str:
@@ -94,41 +106,45 @@ def _join_non_empty(values: List[Any], sep: str = " | ") -> str:
     return sep.join(cleaned)
 
 
-def _read_cell(row: pd.Series, col: str) -> str:
-    if not col:
-        return ""
-    val = row.get(col, "")
-    if pd.isna(val):
-        return ""
-    return val
-
-
-def _read_cols(row: pd.Series, cols: List[str]) -> Dict[str, str]:
-    data = {}
-    for col in cols:
-        val = row.get(col, "")
-        data[col] = "" if pd.isna(val) else val
-    return data
+def _read_col(df: pd.DataFrame, col: str) -> pd.Series:
+    if not col or col not in df.columns:
+        return pd.Series("", index=df.index, dtype=object)
+    return df[col].fillna("")
 
 
 def _parse_json_array(cell: Any) -> List[Dict[str, Any]]:
     if not isinstance(cell, str) or not cell.strip():
         return []
     s = cell.strip().replace("\u00a0", " ")
+    # Some exports use Python-style single quotes; valid JSON can never
+    # have a single quote before its first double quote.
+    single = s.find("'")
+    double = s.find('"')
+    if single != -1 and (double == -1 or single < double):
+        s = s.replace("'", '"')
     try:
-        arr = json.loads(s)
+        arr = _json_loads(s)
     except Exception:
-        try:
-            arr = json.loads(s.replace("'", '"'))
-        except Exception:
-            return []
+        return []
     return arr if isinstance(arr, list) else []
 
 
-def _extract_step_attachments(item: Dict[str, Any]) -> Dict[str, str]:
-    attachments = item.get("attachments", []) if isinstance(item, dict) else []
-    if not isinstance(attachments, list):
-        attachments = []
+STEP_COLS = [
+    "Step #", "Step Type", "Action", "Data", "Expected Result",
+    "Call Test Key", "Call Test Summary", "Call Test Steps Number",
+    "Step Attachments", "Step Attachment URLs", "Step Attachment Paths",
+]
+
+# Step rows are tuples in STEP_COLS order; attachments are the last three
+_NO_ATTACHMENTS = ("", "", "")
+_EMPTY_STEP = (None, "", "", "", "", "", "", "") + _NO_ATTACHMENTS
+
+
+def _extract_step_attachments(item: Dict[str, Any]) -> tuple:
+    attachments = item.get("attachments") if isinstance(item, dict) else None
+    # Most steps carry no attachments; share one blank result for them
+    if not attachments or not isinstance(attachments, list):
+        return _NO_ATTACHMENTS
     filenames = []
     urls = []
     paths = []
@@ -138,56 +154,89 @@ def _extract_step_attachments(item: Dict[str, Any]) -> Dict[str, str]:
         filenames.append(att.get("fileName", ""))
         urls.append(att.get("fileURL", ""))
         paths.append(att.get("filePath", ""))
-    return {
-        "Step Attachments": _join_non_empty(filenames),
-        "Step Attachment URLs": _join_non_empty(urls),
-        "Step Attachment Paths": _join_non_empty(paths),
-    }
+    return (_join_non_empty(filenames), _join_non_empty(urls), _join_non_empty(paths))
+
+
+def _call_step_row(item: Dict[str, Any], call: Dict[str, Any], attachments: tuple) -> tuple:
+    call_key = _clean_text(call.get("issueKey", ""))
+    call_summary = _clean_text(call.get("issueSummary", ""))
+    return (
+        item.get("index"),
+        "Call Test",
+        f"Call Test: {call_key} - {call_summary}".strip(" -"),
+        "",
+        "",
+        call_key,
+        call_summary,
+        call.get("stepsNumber", ""),
+    ) + attachments
+
+
+def _fast_step_rows(arr: List[Any]) -> List[tuple]:
+    """Well-formed Xray steps only; raises on anything unexpected."""
+    out = []
+    for item in arr:
+        attachments = _extract_step_attachments(item)
+        call = item.get("testCallBean")
+        if call:
+            out.append(_call_step_row(item, call, attachments))
+            continue
+        fields = item["fields"]
+        out.append((
+            item["index"],
+            "Manual Step",
+            _clean_text(fields["Action"]),
+            _clean_text(fields["Data"]),
+            _clean_text(fields["Expected Result"]),
+            "",
+            "",
+            "",
+        ) + attachments)
+    return out
 
 
-def parse_manual_steps_cell(cell: Any) -> List[Dict[str, Any]]:
-    """Parse Manual Test Steps. Supports normal steps and Xray Call Test steps."""
-    arr = _parse_json_array(cell)
+def _safe_step_rows(arr: List[Any]) -> List[tuple]:
+    """Tolerates missing keys and wrongly typed items/fields."""
     out = []
-
     for item in arr:
         if not isinstance(item, dict):
             continue
 
-        fields = item.get("fields", {}) if isinstance(item.get("fields", {}), dict) else {}
-        call = item.get("testCallBean", {}) if isinstance(item.get("testCallBean", {}), dict) else {}
+        fields = item.get("fields")
+        if not isinstance(fields, dict):
+            fields = {}
+        call = item.get("testCallBean")
+        if not isinstance(call, dict):
+            call = {}
         attachments = _extract_step_attachments(item)
 
         if call:
-            call_key = _clean_text(call.get("issueKey", ""))
-            call_summary = _clean_text(call.get("issueSummary", ""))
-            out.append({
-                "Step #": item.get("index"),
-                "Step Type": "Call Test",
-                "Action": f"Call Test: {call_key} - {call_summary}".strip(" -"),
-                "Data": "",
-                "Expected Result": "",
-                "Call Test Key": call_key,
-                "Call Test Summary": call_summary,
-                "Call Test Steps Number": call.get("stepsNumber", ""),
-                **attachments,
-            })
+            out.append(_call_step_row(item, call, attachments))
         else:
-            out.append({
-                "Step #": item.get("index"),
-                "Step Type": "Manual Step",
-                "Action": _clean_text(fields.get("Action", "")),
-                "Data": _clean_text(fields.get("Data", "")),
-                "Expected Result": _clean_text(fields.get("Expected Result", "")),
-                "Call Test Key": "",
-                "Call Test Summary": "",
-                "Call Test Steps Number": "",
-                **attachments,
-            })
+            out.append((
+                item.get("index"),
+                "Manual Step",
+                _clean_text(fields.get("Action", "")),
+                _clean_text(fields.get("Data", "")),
+                _clean_text(fields.get("Expected Result", "")),
+                "",
+                "",
+                "",
+            ) + attachments)
 
     return out
 
 
+def parse_step_rows(cell: Any) -> List[tuple]:
+    """Parse Manual Test Steps into row tuples ordered like STEP_COLS."""
+    arr = _parse_json_array(cell)
+    try:
+        return _fast_step_rows(arr)
+    except (KeyError, TypeError, AttributeError):
+        # Fall back once per cell, not per step
+        return _safe_step_rows(arr)
+
+
 # Xray/Jira import-critical and preservation fields.
 # The left side is output name; the right side contains possible CSV export column names.
 OPTIONAL_IMPORT_FIELDS = {
@@ -220,63 +269,62 @@ def detect_optional_fields(cols: List[str]) -> Dict[str, str]:
     return detected
 
 
+def mapped_cols(col_map: Dict[str, Any]) -> List[str]:
+    """Source columns referenced by `col_map`, in first-use order."""
+    cols = [col_map[k] for k in ("key", "priority", "sum", "desc", "steps")]
+    cols.extend(col_map["optional"].values())
+    for group in ("labels", "test_sets_extra", "precond_extra", "link_cols", "attachment_cols"):
+        cols.extend(col_map[group])
+    return [c for c in dict.fromkeys(cols) if c]
+
+
 def build_flat(df: pd.DataFrame, col_map: Dict[str, Any]) -> pd.DataFrame:
-    rows = []
-
-    for _, r in df.iterrows():
-        key = _read_cell(r, col_map["key"])
-        prio = _read_cell(r, col_map["priority"])
-        summ = _read_cell(r, col_map["sum"])
-        desc = _read_cell(r, col_map["desc"])
-
-        base_info = {
-            "Issue key": key,
-            "Priority": prio,
-            "Summary": summ,
-            "Description": desc,
-        }
-
-        # Optional import/preservation fields
-        for out_name, src_col in col_map["optional"].items():
-            base_info[out_name] = _read_cell(r, src_col)
-
-        # Duplicate fields that Jira exports as repeated columns
-        base_info.update(_read_cols(r, col_map["labels"]))
-        base_info.update(_read_cols(r, col_map["test_sets_extra"]))
-        base_info.update(_read_cols(r, col_map["precond_extra"]))
-        base_info.update(_read_cols(r, col_map["link_cols"]))
-        base_info.update(_read_cols(r, col_map["attachment_cols"]))
-
-        steps_cell = _read_cell(r, col_map["steps"])
-        steps = parse_manual_steps_cell(steps_cell)
-
-        if not steps:
-            rows.append({
-                **base_info,
-                "Step #": None,
-                "Step Type": "",
-                "Action": "",
-                "Data": "",
-                "Expected Result": "",
-                "Call Test Key": "",
-                "Call Test Summary": "",
-                "Call Test Steps Number": "",
-                "Step Attachments": "",
-                "Step Attachment URLs": "",
-                "Step Attachment Paths": "",
-            })
-        else:
-            for s in steps:
-                rows.append({**base_info, **s})
+    # Jira "All fields" exports are wide; drop unused columns before any copy
+    df = df[[c for c in mapped_cols(col_map) if c in df.columns]].reset_index(drop=True)
+
+    base_info = {
+        "Issue key": _read_col(df, col_map["key"]),
+        "Priority": _read_col(df, col_map["priority"]),
+        "Summary": _read_col(df, col_map["sum"]),
+        "Description": _read_col(df, col_map["desc"]),
+    }
 
-    flat = pd.DataFrame(rows)
+    # Optional import/preservation fields
+    for out_name, src_col in col_map["optional"].items():
+        base_info[out_name] = _read_col(df, src_col)
+
+    # Duplicate fields that Jira exports as repeated columns
+    for group in ("labels", "test_sets_extra", "precond_extra", "link_cols", "attachment_cols"):
+        for col in col_map[group]:
+            base_info[col] = _read_col(df, col)
+
+    base = pd.DataFrame(base_info)
+    # Repeated on every step row; categoricals store each distinct value once
+    for col in ("Issue key", "Summary"):
+        base[col] = base[col].astype("category")
+
+    # One list of steps per issue, flattened to one row per step.
+    # Issues without steps keep a single blank step row.
+    steps = [parse_step_rows(c) for c in _read_col(df, col_map["steps"]).tolist()]
+    steps = [s if s else [_EMPTY_STEP] for s in steps]
+    step_rows = [step for issue_steps in steps for step in issue_steps]
+
+    flat = pd.concat(
+        [
+            base.loc[base.index.repeat([len(s) for s in steps])].reset_index(drop=True),
+            pd.DataFrame.from_records(step_rows, columns=STEP_COLS),
+        ],
+        axis=1,
+    )
 
     if flat.empty:
         return flat
 
-    uniques = pd.unique(flat["Issue key"])
-    case_map = {k: i + 1 for i, k in enumerate([u for u in uniques if pd.notna(u) and u != ""])}
-    flat.insert(0, "Case #", flat["Issue key"].map(case_map))
+    # Case numbers follow first appearance; blank keys get no number
+    keys = flat["Issue key"]
+    codes, _ = pd.factorize(keys.where(keys != ""))
+    case_no = pd.Series(codes + 1, index=flat.index)
+    flat.insert(0, "Case #", case_no.where(codes >= 0))
 
     ordered_cols = ["Case #", "Issue key", "Project key", "Issue Type", "Status", "Priority", "Summary", "Description"]
 
@@ -306,19 +354,7 @@ def build_flat(df: pd.DataFrame, col_map: Dict[str, Any]) -> pd.DataFrame:
     ordered_cols.extend(col_map["link_cols"])
     ordered_cols.extend(col_map["attachment_cols"])
 
-    ordered_cols.extend([
-        "Step #",
-        "Step Type",
-        "Action",
-        "Data",
-        "Expected Result",
-        "Call Test Key",
-        "Call Test Summary",
-        "Call Test Steps Number",
-        "Step Attachments",
-        "Step Attachment URLs",
-        "Step Attachment Paths",
-    ])
+    ordered_cols.extend(STEP_COLS)
 
     # Keep only existing cols and avoid duplicates in UI order
     seen = set()
@@ -336,20 +372,104 @@ def build_flat(df: pd.DataFrame, col_map: Dict[str, Any]) -> pd.DataFrame:
     return flat[final_cols]
 
 
-def collapse_repeats(df: pd.DataFrame, group_col: str, cols_to_blank: List[str]) -> pd.DataFrame:
+def collapse_repeats(df: pd.DataFrame, group_col: str, cols_to_blank: List[str], inplace: bool = False) -> pd.DataFrame:
     if df.empty or group_col not in df.columns:
         return df
-    out = df.copy()
+    out = df if inplace else df.copy()
     safe_cols = [c for c in cols_to_blank if c in out.columns]
-    for _, idx in out.groupby(group_col, sort=False).groups.items():
-        if len(idx) > 1:
-            out.loc[idx[1:], safe_cols] = ""
+    # Every row after the first of its group; rows without a group are kept
+    groups = out[group_col]
+    repeated = groups.duplicated(keep="first") & groups.notna()
+    for c in safe_cols:
+        if isinstance(out[c].dtype, pd.CategoricalDtype) and "" not in out[c].cat.categories:
+            out[c] = out[c].cat.add_categories([""])
+    out.loc[repeated, safe_cols] = ""
     return out
 
 
-def df_to_csv_bom(df: pd.DataFrame, sep: str = ";") -> bytes:
-    csv_str = df.to_csv(index=False, sep=sep, encoding="utf-8-sig")
-    return csv_str.encode("utf-8-sig")
+def detect_sep(data: bytes) -> str:
+    """Pick ; or , from the header record; Jira exports default to ;."""
+    header = data[:65536].split(b"\n", 1)[0]
+    return "," if header.count(b",") > header.count(b";") else ";"
+
+
+def read_csv_header(data: bytes, sep: str = ";") -> List[str]:
+    """Column names only, with pandas' .1/.2 suffixes for duplicates."""
+    return pd.read_csv(io.BytesIO(data), sep=sep, nrows=0).columns.tolist()
+
+
+def read_csv_arrow(data: bytes, sep: str = ";", usecols: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Read a Jira CSV with the pyarrow parser into Arrow-backed string columns.
+    Column names come from pandas so duplicates keep their .1/.2 suffixes,
+    and every column is read as text so dates/numbers are not reformatted.
+    Only `usecols` are converted when given.
+    """
+    names = read_csv_header(data, sep=sep)
+    table = pa_csv.read_csv(
+        io.BytesIO(data),
+        read_options=pa_csv.ReadOptions(column_names=names, skip_rows=1),
+        parse_options=pa_csv.ParseOptions(delimiter=sep, newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={n: pa.string() for n in usecols or names},
+            include_columns=usecols,
+            strings_can_be_null=True,
+        ),
+    )
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def _arrow_column(col: pd.Series) -> "pa.Array":
+    try:
+        return pa.array(col, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed object columns (e.g. step numbers next to "") are written as text
+        return pa.array(col.astype("string"), from_pandas=True)
+
+
+def df_to_arrow_table(df: pd.DataFrame) -> "pa.Table":
+    # Built column by column: Jira exports keep duplicate column names,
+    # which pa.Table.from_pandas refuses.
+    return pa.Table.from_arrays(
+        [_arrow_column(df.iloc[:, i]) for i in range(df.shape[1])],
+        names=[str(c) for c in df.columns],
+    )
+
+
+def collapse_repeats_arrow(table: "pa.Table", group_col: str, cols_to_blank: List[str]) -> "pa.Table":
+    """Arrow counterpart of `collapse_repeats`, used on the export path."""
+    if table.num_rows == 0 or group_col not in table.column_names:
+        return table
+    # A row repeats its group unless it is the group's first row; rows
+    # without a group value are never blanked.
+    groups = table.column(group_col)
+    rows = pa.array(range(table.num_rows), type=pa.int64())
+    first_rows = (
+        pa.table({"group": groups, "row": rows})
+        .group_by("group", use_threads=False)
+        .aggregate([("row", "min")])
+        .column("row_min")
+    )
+    repeated = pc.and_(pc.invert(pc.is_in(rows, value_set=first_rows)), pc.is_valid(groups))
+    blank = set(cols_to_blank)
+    columns = []
+    for name, col in zip(table.column_names, table.columns):
+        if name in blank:
+            col = pc.if_else(repeated, "", col.cast(pa.string()))
+        columns.append(col)
+    return pa.Table.from_arrays(columns, names=table.column_names)
+
+
+def arrow_to_csv_bom(table: "pa.Table", sep: str = ";") -> bytes:
+    buf = io.BytesIO()
+    buf.write("\ufeff".encode("utf-8"))
+    pa_csv.write_csv(table, buf, write_options=pa_csv.WriteOptions(delimiter=sep))
+    return buf.getvalue()
+
+
+def metadata_cols(cols: List[str]) -> List[str]:
+    """Columns that repeat per issue, i.e. blanked when collapsing repeats."""
+    return [c for c in cols if c not in STEP_COLS and c != "Case #"]
 
 
 def make_jira_export_column_names(df: pd.DataFrame) -> pd.DataFrame:
@@ -365,10 +485,84 @@ def make_jira_export_column_names(df: pd.DataFrame) -> pd.DataFrame:
     return df.rename(columns=rename_map)
 
 
+# ---------------------------
+# Cached pipeline
+# ---------------------------
+# Streamlit reruns the whole script on every widget interaction; the
+# steps below are keyed on the uploaded bytes so reruns reuse them.
+# Entries are bounded so a long-running server does not keep every upload.
+CACHE_MAX_ENTRIES = 4
+CACHE_TTL_SECONDS = 3600
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS)
+def load_header(data: bytes) -> List[str]:
+    return read_csv_header(data, sep=detect_sep(data))
+
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS)
+def load_csv(data: bytes, usecols: Optional[List[str]] = None) -> pd.DataFrame:
+    # Jira exports carry dozens of unused columns; only `usecols` are parsed.
+    # The separator is the one load_header used, so `usecols` always match.
+    sep = detect_sep(data)
+    try:
+        return read_csv_arrow(data, sep=sep, usecols=usecols)
+    except Exception:
+        pass
+    return pd.read_csv(io.BytesIO(data), sep=sep, usecols=usecols, dtype=str, low_memory=False)
+
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS)
+def raw_row_count(data: bytes, usecols: List[str]) -> int:
+    # Same load_csv arguments as parse_upload, so the read is shared
+    return len(load_csv(data, usecols or None))
+
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS)
+def parse_upload(data: bytes, col_map: Dict[str, Any]) -> pd.DataFrame:
+    return build_flat(load_csv(data, mapped_cols(col_map)), col_map)
+
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS)
+def upload_metrics(data: bytes, col_map: Dict[str, Any]) -> Dict[str, int]:
+    # Counted on the parsed frame before collapse_repeats blanks Issue key
+    flat = parse_upload(data, col_map)
+    if flat.empty:
+        return {"rows": 0, "cases": 0, "steps": 0, "call_steps": 0}
+    keys = flat["Issue key"]
+    return {
+        "rows": len(flat),
+        "cases": int(keys[keys != ""].nunique()),
+        "steps": int(flat["Step #"].notna().sum()),
+        "call_steps": int((flat["Step Type"] == "Call Test").sum()),
+    }
+
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS)
+def view_upload(data: bytes, col_map: Dict[str, Any], collapse: bool, max_rows: int) -> pd.DataFrame:
+    # Only the on-screen preview is collapsed in pandas; the first rows of
+    # each case are the same in the head as in the full frame.
+    flat = parse_upload(data, col_map).head(max_rows)
+    if collapse and not flat.empty:
+        flat = collapse_repeats(flat, group_col="Case #", cols_to_blank=metadata_cols(flat.columns))
+    return flat
+
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS)
+def export_upload(data: bytes, col_map: Dict[str, Any], collapse: bool, sep: str) -> bytes:
+    flat = parse_upload(data, col_map)
+    # Export names may repeat (Labels, Labels); the Arrow path handles that
+    table = df_to_arrow_table(make_jira_export_column_names(flat))
+    if collapse:
+        table = collapse_repeats_arrow(table, group_col="Case #", cols_to_blank=metadata_cols(table.column_names))
+    return arrow_to_csv_bom(table, sep=sep)
+
+
 # ---------------------------
 # UI
 # ---------------------------
 
+PREVIEW_ROWS = 1000
+
 st.set_page_config(page_title="Xray Steps Parser", page_icon="✅", layout="wide")
 st.title("Xray Test Steps Parser")
 st.caption("CSV All Fields → Ayrıştırılmış step tablosu + import için kritik Xray/Jira alanları")
@@ -379,14 +573,8 @@ if uploaded is None:
     st.info("Örnek: Jira 'Export → CSV (All fields)' çıktısı. Zorunlu sütun: 'Custom field (Manual Test Steps)'.")
     st.stop()
 
-try:
-    df_raw = pd.read_csv(uploaded, sep=";", dtype=str, low_memory=False)
-except Exception:
-    df_raw = pd.read_csv(uploaded, dtype=str, low_memory=False)
-
-st.success(f"Yüklendi: {len(df_raw)} satır, {len(df_raw.columns)} sütun")
-
-cols_list = df_raw.columns.tolist()
+upload_bytes = uploaded.getvalue()
+cols_list = load_header(upload_bytes)
 
 # Detect duplicate groups
 labels_cols = get_strict_cols(cols_list, "Labels")
@@ -418,6 +606,8 @@ col_map = {
     "optional": optional_detected,
 }
 
+st.success(f"Yüklendi: {raw_row_count(upload_bytes, mapped_cols(col_map))} satır, {len(cols_list)} sütun")
+
 missing = []
 if not col_map["steps"]:
     missing.append("Manual Test Steps")
@@ -451,46 +641,31 @@ with st.expander("Sütun eşlemesi / import için korunan alanlar"):
 
 collapse_opt = st.checkbox("Üst veri (Issue key, Summary, Priority, linkler vb.) sadece ilk satırda görünsün", value=True)
 
-flat = build_flat(df_raw, col_map)
-
-if collapse_opt and not flat.empty:
-    step_cols = {
-        "Step #", "Step Type", "Action", "Data", "Expected Result",
-        "Call Test Key", "Call Test Summary", "Call Test Steps Number",
-        "Step Attachments", "Step Attachment URLs", "Step Attachment Paths"
-    }
-    cols_to_blank = [c for c in flat.columns if c not in step_cols and c != "Case #"]
-    flat = collapse_repeats(flat, group_col="Case #", cols_to_blank=cols_to_blank)
+metrics = upload_metrics(upload_bytes, col_map)
 
 # Metrics
 left, mid1, mid2, right = st.columns(4)
 with left:
-    st.metric("Toplam Case", df_raw[col_map["key"]].replace("", pd.NA).nunique())
+    st.metric("Toplam Case", metrics["cases"])
 with mid1:
-    st.metric("Toplam Step", int(flat["Step #"].notna().sum()) if "Step #" in flat.columns else 0)
+    st.metric("Toplam Step", metrics["steps"])
 with mid2:
-    st.metric("Call Test Adımı", int((flat["Step Type"] == "Call Test").sum()) if "Step Type" in flat.columns else 0)
+    st.metric("Call Test Adımı", metrics["call_steps"])
 with right:
     st.metric("Link Kolonu", len(col_map["link_cols"]))
 
 st.subheader("Ayrıştırılmış Test Adımları")
-st.dataframe(flat, use_container_width=True)
-
-# Export column names
-flat_export = make_jira_export_column_names(flat)
-
-colA, colB = st.columns(2)
-with colA:
-    st.download_button(
-        label="CSV indir (UTF-8 BOM, ; ile)",
-        data=df_to_csv_bom(flat_export, sep=";"),
-        file_name="manual_test_steps_import_safe_utf8.csv",
-        mime="text/csv",
-    )
-with colB:
-    st.download_button(
-        label="CSV indir (UTF-8 BOM, , ile)",
-        data=df_to_csv_bom(flat_export, sep=","),
-        file_name="manual_test_steps_import_safe_utf8_comma.csv",
-        mime="text/csv",
-    )
+# Only a preview is sent to the browser; the download always has every row
+preview = view_upload(upload_bytes, col_map, collapse_opt, PREVIEW_ROWS)
+st.dataframe(preview, use_container_width=True)
+if metrics["rows"] > PREVIEW_ROWS:
+    st.caption(f"İlk {PREVIEW_ROWS} / {metrics['rows']} satır gösteriliyor — tüm veri için CSV indirin")
+
+# Only the chosen separator is serialized on each rerun
+sep_opt = st.radio("CSV ayırıcı", [";", ","], horizontal=True)
+st.download_button(
+    label=f"CSV indir (UTF-8 BOM, {sep_opt} ile)",
+    data=export_upload(upload_bytes, col_map, collapse_opt, sep_opt),
+    file_name="manual_test_steps_import_safe_utf8.csv" if sep_opt == ";" else "manual_test_steps_import_safe_utf8_comma.csv",
+    mime="text/csv",
+)